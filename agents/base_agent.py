@@ -1,15 +1,30 @@
 from uagents import Agent, Context, Model
 from loguru import logger
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from agents.registry import register_agent, get_agent_address, registry
+from agents.log_sink import log_sink
 from dotenv import load_dotenv
+import sys
+
+# Use uvloop when available - must happen before any Agent creates its loop
+if sys.platform != "win32":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+load_dotenv()
 
 class BaseAgentConfig(Model):
     """Base configuration for all agents"""
     agent_name: str
     agent_description: str
     seed_phrase: Optional[str] = None
+    
+    class Config:
+        allow_mutation = False
 
 class AgentMessage(Model):
     """Standard message format between agents"""
@@ -18,8 +33,19 @@ class AgentMessage(Model):
     message_type: str
     payload: Dict[str, Any]
     timestamp: float
+    
+    class Config:
+        allow_mutation = False
 
 class BaseSuraAgent:
+    # One file handler for every agent in the process; records are routed to
+    # logs/<agent>.log by the `agent` extra field
+    _log_handler_id: Optional[int] = None
+    # Process-wide default `agent` extra for module-level logger calls; set by
+    # the first agent only, so a second agent in the same process (experiments)
+    # never relabels the first one's records
+    _default_log_agent: Optional[str] = None
+    
     def __init__(
         self, 
         name: str, 
@@ -28,8 +54,6 @@ class BaseSuraAgent:
         capabilities: List[str] = None,
         endpoint: Optional[str] = None
     ):
-        load_dotenv()
-        
         self.agent = Agent(
             name=name,
             seed=seed,
@@ -39,18 +63,26 @@ class BaseSuraAgent:
         self.name = name
         self.capabilities = capabilities or []
         
-        # Setup logging
-        logger.add(
-            f"logs/{name}.log",
-            rotation="100 MB",
-            retention="7 days",
-            level="INFO"
-        )
+        # Peer address cache: name -> (address, registry version it was resolved at)
+        self._peer_cache: Dict[str, Tuple[str, int]] = {}
+        
+        # Setup logging (buffered - one shared flusher thread, WARN+ written immediately)
+        if BaseSuraAgent._log_handler_id is None:
+            BaseSuraAgent._log_handler_id = log_sink.attach(
+                logger,
+                "logs/{agent}.log",
+                level="INFO",
+                enqueue=True
+            )
+        if BaseSuraAgent._default_log_agent is None:
+            BaseSuraAgent._default_log_agent = name
+            logger.configure(extra={"agent": name})
+        self.logger = logger.bind(agent=name)
         
-        logger.info(f"✅ {name} initialized (Mailbox mode)")
-        logger.info(f"   Address: {self.agent.address}")
-        logger.info(f"   Port: {port} (local backup)")
-        logger.info(f"   📬 Mailbox: ENABLED - Register this address on Agentverse!")
+        self.logger.info(f"✅ {name} initialized (Mailbox mode)")
+        self.logger.info(f"   Address: {self.agent.address}")
+        self.logger.info(f"   Port: {port} (local backup)")
+        self.logger.info(f"   📬 Mailbox: ENABLED - Register this address on Agentverse!")
         
         # Auto-register in registry
         self.register_self()
@@ -64,35 +96,49 @@ class BaseSuraAgent:
                 port=self.agent._port,
                 capabilities=self.capabilities
             )
-            logger.info(f"📝 Registered {self.name} in agent registry")
+            self.logger.info(f"📝 Registered {self.name} in agent registry")
         except Exception as e:
-            logger.error(f"Failed to register agent: {e}")
+            self.logger.error(f"Failed to register agent: {e}")
     
     def get_peer_address(self, peer_name: str) -> Optional[str]:
-        """Get another agent's address from registry"""
+        """Get another agent's address from registry (cached until the registry changes)"""
+        cached = self._peer_cache.get(peer_name)
+        if cached and cached[1] == registry.version:
+            return cached[0]
+        
         address = get_agent_address(peer_name)
         if address:
-            logger.debug(f"Found {peer_name} at {address[:20]}...")
+            self._peer_cache[peer_name] = (address, registry.version)
+            self.logger.debug(f"Found {peer_name} at {address[:20]}...")
         else:
-            logger.warning(f"Agent {peer_name} not found in registry")
+            self.logger.warning(f"Agent {peer_name} not found in registry")
         return address
     
     async def send_to_peer(self, ctx: Context, peer_name: str, message: Model) -> bool:
        
         address = self.get_peer_address(peer_name)
         if not address:
-            logger.error(f"❌ Cannot send to {peer_name} - not in registry")
+            self.logger.error(f"❌ Cannot send to {peer_name} - not in registry")
             return False
         
         try:
             # Use standard ctx.send - it handles all routing automatically
             await ctx.send(address, message)
-            logger.info(f"✅ Sent {message.__class__.__name__} to {peer_name}")
+            self.logger.info(f"✅ Sent {message.__class__.__name__} to {peer_name}")
             return True
         except Exception as e:
-            logger.error(f"❌ Failed to send to {peer_name}: {e}")
+            # Address may be stale - resolve again on the next send
+            self._peer_cache.pop(peer_name, None)
+            self.logger.error(f"❌ Failed to send to {peer_name}: {e}")
             return False
     
+    @staticmethod
+    def increment_counter(ctx: Context, key: str, amount: int = 1) -> int:
+        """Add `amount` to a storage counter (missing counts as 0); returns the new value"""
+        value = (ctx.storage.get(key) or 0) + amount
+        ctx.storage.set(key, value)
+        return value
+    
     def get_agent(self):
         return self.agent
     
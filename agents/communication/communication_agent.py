@@ -1,21 +1,47 @@
-from uagents import Context, Model
+from uagents import Context
 import os
 
 
-from agents.messages import ResponseAction, StatusUpdate
+from agents.messages import ResponseAction, ResponseActionBatch, StatusUpdate
 
 from agents.base_agent import BaseSuraAgent
 
 
-from typing import List
+from typing import List, Optional, Tuple
+import asyncio
 from loguru import logger
-from dotenv import load_dotenv
-from datetime import datetime
-import json
+import orjson
+import hashlib
+
+class BloomFilter:
+    """Fixed-size bloom filter for cheap duplicate checks (false positives possible, no false negatives)"""
+    
+    def __init__(self, size_bytes: int = 64 * 1024, num_hashes: int = 4):
+        self.num_bits = size_bytes * 8
+        self.num_hashes = num_hashes
+        self.bits = bytearray(size_bytes)
+    
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    
+    def add(self, key: str) -> bool:
+        """Add key; returns True if it was (probably) already present"""
+        present = True
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        return present
+    
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
 
 class CommunicationAgent(BaseSuraAgent):
     def __init__(self):
-        load_dotenv()
         super().__init__(
             name="communication_agent",
             seed=os.getenv("COMMUNICATION_SEED_PHRASE"),
@@ -23,9 +49,23 @@ class CommunicationAgent(BaseSuraAgent):
             capabilities=["notifications", "status_updates", "stakeholder_communication"]
         )
         
-        self.status_page = []
         self.notifications_sent = 0
         
+        # Append-only status log (one StatusUpdate per line) - O(1) per update
+        self.status_log_path = "status_page.jsonl"
+        self._status_fd: Optional[int] = os.open(
+            self.status_log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+        )
+        
+        # Handlers enqueue status updates; flush_loop publishes them in batches
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.max_batch_size = 64
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # Drops re-delivered (action_id, status) pairs; reset hourly to bound saturation
+        self._seen_actions = BloomFilter()
+        self.dedup_reset_interval = 3600  # seconds
+        
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -36,59 +76,122 @@ class CommunicationAgent(BaseSuraAgent):
             # ✅ Initialize storage
             ctx.storage.set("notifications_sent", 0)
             logger.info(f"✅ Storage initialized: notifications_sent=0")
+            
+            # Start background publisher
+            self._flush_task = asyncio.create_task(self.flush_loop(ctx))
+        
+        @self.agent.on_event("shutdown")
+        async def shutdown(ctx: Context):
+            # Stop the publisher, then publish whatever it hadn't picked up yet
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            if pending:
+                logger.info("📤 Publishing {} queued status updates before shutdown", len(pending))
+                await self.publish_status_updates(ctx, pending)
+            
+            if self._status_fd is not None:
+                os.close(self._status_fd)
+                self._status_fd = None
+        
+        @self.agent.on_interval(period=self.dedup_reset_interval)
+        async def reset_dedup(ctx: Context):
+            self._seen_actions.clear()
         
         @self.agent.on_message(model=ResponseAction)
         async def handle_action(ctx: Context, sender: str, msg: ResponseAction):
-            logger.info(f"📨 Received action notification: {msg.action_type}")
-            logger.info(f"   From: {sender[:20]}...")
-            logger.info(f"   Action ID: {msg.action_id}")
-            logger.info(f"   Status: {msg.status}")
-            
-            # Create status update
-            status = StatusUpdate(
-                incident_id=msg.action_id,
-                status="RESOLVED" if msg.status == "COMPLETED" else "MITIGATING",
-                title=f"{msg.action_type} - {msg.reason}",
-                description=f"Automated {msg.action_type} executed on {len(msg.target_systems)} systems",
-                affected_services=msg.target_systems,
-                timestamp=msg.timestamp
-            )
-            
-            # Publish status update
-            await self.publish_status_update(ctx, status)
-            
-            # Send notifications
-            await self.send_notifications(ctx, status)
+            self.accept_action(sender, msg)
+        
+        @self.agent.on_message(model=ResponseActionBatch)
+        async def handle_action_batch(ctx: Context, sender: str, msg: ResponseActionBatch):
+            logger.info("📦 Received {} actions in one message from {}...", len(msg.actions), sender[:20])
+            for action in msg.actions:
+                self.accept_action(sender, action)
+    
+    def accept_action(self, sender: str, msg: ResponseAction):
+        """Turn one action into a status update and queue it for the publisher"""
+        if self._seen_actions.add(f"{msg.action_id}|{msg.status}"):
+            logger.info("🔁 Duplicate action {} ({}) ignored", msg.action_id, msg.status)
+            return
+        
+        logger.info("📨 Received action notification: {} ({}, {}) from {}...",
+                    msg.action_type, msg.action_id, msg.status, sender[:20])
+        
+        # Create status update - fields come from an already-validated ResponseAction
+        fields = {
+            "incident_id": msg.action_id,
+            "status": "RESOLVED" if msg.status == "COMPLETED" else "MITIGATING",
+            "title": f"{msg.action_type} - {msg.reason}",
+            "description": f"Automated {msg.action_type} executed on {len(msg.target_systems)} systems",
+            "affected_services": msg.target_systems,
+            "timestamp": msg.timestamp
+        }
+        status = StatusUpdate.construct(**fields)
+        
+        # Serialize once here (the publisher writes these bytes as-is) and
+        # hand off to the background publisher - return right away
+        self._queue.put_nowait((status, orjson.dumps(fields)))
+    
+    async def flush_loop(self, ctx: Context):
+        """Publish queued status updates in batches - one write and one storage update per batch"""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty() and len(batch) < self.max_batch_size:
+                batch.append(self._queue.get_nowait())
             
-            # ✅ Update storage IMMEDIATELY
-            notifications_sent = ctx.storage.get("notifications_sent") or 0
-            ctx.storage.set("notifications_sent", notifications_sent + 1)
-            logger.info(f"📊 Notifications sent updated: {notifications_sent + 1}")
+            try:
+                # Publish status updates
+                await self.publish_status_updates(ctx, batch)
+                
+                # Send notifications
+                await asyncio.gather(*(self.send_notifications(ctx, status) for status, _ in batch))
+                
+                notifications_sent = self.increment_counter(ctx, "notifications_sent", len(batch))
+                logger.info("📊 Notifications sent updated: {}", notifications_sent)
+            except Exception as e:
+                logger.error("❌ Failed to publish {} status updates: {}", len(batch), e)
     
-    async def publish_status_update(self, ctx: Context, status: StatusUpdate):
-        """Publish to status page"""
-        self.status_page.append(status.dict())
-        logger.info(f"📄 Status page updated: {status.title}")
+    async def publish_status_updates(self, ctx: Context, updates: List[Tuple[StatusUpdate, bytes]]):
+        """Publish a batch of (update, serialized update) pairs to the status page"""
+        blobs = [blob for _, blob in updates]
+        for status, _ in updates:
+            logger.info("📄 Status page updated: {}", status.title)
         
-        # Write to file for dashboard
+        # Append one line per update for the dashboard - a single write for the batch
         try:
-            with open("status_page.json", "w") as f:
-                json.dump(self.status_page, f, indent=2)
-            logger.info(f"✅ Status page file updated")
+            os.write(self._status_fd, b"\n".join(blobs) + b"\n")
+            logger.info("✅ Status page file updated")
         except Exception as e:
-            logger.error(f"❌ Failed to write status page: {e}")
+            logger.error("❌ Failed to write status page: {}", e)
     
     async def send_notifications(self, ctx: Context, status: StatusUpdate):
-        """Send notifications to stakeholders"""
-        # In production: email, Slack, PagerDuty, SMS, etc.
-        logger.info(f"🔔 NOTIFICATION SENT:")
-        logger.info(f"   Title: {status.title}")
-        logger.info(f"   Status: {status.status}")
-        logger.info(f"   Incident ID: {status.incident_id}")
-        logger.info(f"   Affected: {', '.join(status.affected_services[:3])}")
+        """Send notifications to stakeholders - all channels concurrently"""
+        channels = (self._notify_slack, self._notify_pagerduty, self._notify_email)
+        results = await asyncio.gather(*(channel(status) for channel in channels), return_exceptions=True)
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error("❌ Channel {} failed: {}", channel.__name__, result)
         
-        if len(status.affected_services) > 3:
-            logger.info(f"   ... and {len(status.affected_services) - 3} more systems")
+        logger.info("🔔 NOTIFICATION SENT: {} [{} {}]", status.title, status.incident_id, status.status)
+        logger.opt(lazy=True).info(
+            "   Affected: {}{}",
+            lambda: ', '.join(status.affected_services[:3]),
+            lambda: (f" ... and {len(status.affected_services) - 3} more systems"
+                     if len(status.affected_services) > 3 else "")
+        )
+    
+    # Notification channels - in production: Slack webhook, PagerDuty Events API, SMTP
+    async def _notify_slack(self, status: StatusUpdate):
+        return None
+    
+    async def _notify_pagerduty(self, status: StatusUpdate):
+        return None
+    
+    async def _notify_email(self, status: StatusUpdate):
+        return None
 
 communication_agent = CommunicationAgent()
 agent = communication_agent.get_agent()
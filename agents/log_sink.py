@@ -0,0 +1,174 @@
+"""
+Buffered loguru file sink shared by all SuraAI agents.
+
+Formatted records are held in memory and written by one background thread
+once per flush interval, so agent event loops never block on per-record disk
+I/O. WARNING and above are flushed immediately so alerts are never delayed.
+"""
+
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from glob import escape, glob
+from typing import Callable, Deque, Dict
+
+WARNING_LEVEL_NO = 30
+
+
+class BufferedFileSink:
+    """Batches log lines per file and flushes them with a single write"""
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        rotation_bytes: int = 100 * 1024 * 1024,
+        retention_seconds: float = 7 * 24 * 3600,
+    ):
+        self.flush_interval = flush_interval
+        self.rotation_bytes = rotation_bytes
+        self.retention_seconds = retention_seconds
+        self._buffers: Dict[str, Deque[str]] = {}
+        self._fds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._logger = None
+        self._handler_id = None
+        self._previous_sigterm = None
+
+    def attach(self, logger, path_template: str, **options) -> int:
+        """Add this sink to a loguru logger and return the handler id
+
+        close() removes the handler first, which drains loguru's enqueue
+        queue through the sink before the final flush.
+        """
+        self._logger = logger
+        self._handler_id = logger.add(self.writer(path_template), **options)
+        self._install_sigterm()
+        return self._handler_id
+
+    def writer(self, path_template: str) -> Callable:
+        """Return a loguru sink callable routing records by their `agent` extra
+
+        `path_template` is formatted with the record's extra fields, e.g.
+        "logs/{agent}.log". Records without an agent are dropped.
+        """
+
+        def write(message):
+            extra = message.record["extra"]
+            if "agent" not in extra:
+                return
+            path = path_template.format(**extra)
+            buffer = self._buffers.get(path)
+            if buffer is None:
+                with self._lock:
+                    buffer = self._buffers.setdefault(path, deque())
+            buffer.append(message)
+            if self._closed or message.record["level"].no >= WARNING_LEVEL_NO:
+                self.flush()
+
+        self._ensure_thread()
+        return write
+
+    def flush(self, timeout: float = -1) -> None:
+        """Write every pending line to disk (gives up if the lock isn't free within timeout)"""
+        if not self._lock.acquire(timeout=timeout):
+            return
+        try:
+            for path, buffer in self._buffers.items():
+                if not buffer:
+                    continue
+                lines = []
+                while buffer:
+                    lines.append(buffer.popleft())
+                fd = self._open(path)
+                os.write(fd, "".join(lines).encode("utf-8"))
+                if os.fstat(fd).st_size >= self.rotation_bytes:
+                    self._rotate(path)
+        finally:
+            self._lock.release()
+
+    def _open(self, path: str) -> int:
+        fd = self._fds.get(path)
+        if fd is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._fds[path] = fd
+        return fd
+
+    def _rotate(self, path: str) -> None:
+        os.close(self._fds.pop(path))
+        os.replace(path, f"{path}.{time.strftime('%Y-%m-%d_%H-%M-%S')}")
+        cutoff = time.time() - self.retention_seconds
+        for old in glob(f"{escape(path)}.*"):
+            if os.path.getmtime(old) < cutoff:
+                os.remove(old)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="sura-log-flusher", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _install_sigterm(self) -> None:
+        """Flush on SIGTERM too - atexit handlers do not run on a plain kill"""
+        if self._previous_sigterm is not None:
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._previous_sigterm = signal.getsignal(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _on_sigterm(self, signum, frame) -> None:
+        # No loguru calls here: the signal can land inside a logger call on this
+        # thread, where removing the handler raises instead of draining. Write
+        # what is buffered, then exit normally so atexit runs close()
+        try:
+            self.flush(timeout=1.0)
+        except Exception as e:
+            sys.stderr.write(f"sura-log-flusher: flush on SIGTERM failed: {e}\n")
+        previous = self._previous_sigterm
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            raise SystemExit(128 + signum)
+
+    def _run(self) -> None:
+        while not self._wakeup.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                sys.stderr.write(f"sura-log-flusher: flush failed: {e}\n")
+
+    def close(self) -> None:
+        """Drain loguru, stop the flusher thread and write whatever is left
+
+        Records that arrive after close() are written through immediately.
+        """
+        if self._handler_id is not None:
+            handler_id, self._handler_id = self._handler_id, None
+            try:
+                self._logger.remove(handler_id)
+            except (ValueError, RuntimeError):
+                pass
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+# Shared by every agent in the process - one flusher thread total
+log_sink = BufferedFileSink()
@@ -12,6 +12,9 @@ class UpdatePackage(Model):
     description: str
     target_systems: List[str]
     timestamp: float
+    
+    class Config:
+        allow_mutation = False
 
 class CanaryTestResult(Model):
     """Result of canary testing"""
@@ -22,6 +25,9 @@ class CanaryTestResult(Model):
     latency_impact: float
     recommendation: str  # "DEPLOY", "ROLLBACK", "INVESTIGATE"
     details: str
+    
+    class Config:
+        allow_mutation = False
 
 # ============================================================================
 # MONITORING AGENT MESSAGES
@@ -63,6 +69,10 @@ class ResponseAction(Model):
     timestamp: float
     lava_request_id: str = ""  # Track Lava usage
 
+class ResponseActionBatch(Model):
+    """Several actions that completed together, delivered as one message"""
+    actions: List[ResponseAction]
+
 # ============================================================================
 # COMMUNICATION AGENT MESSAGES
 # ============================================================================
@@ -1,39 +1,45 @@
-from uagents import Context, Model
+from uagents import Context
 import os
 from agents.base_agent import BaseSuraAgent
-from agents.messages import SystemMetrics, AnomalyAlert  # ← CHANGE THIS
+from agents.messages import SystemMetrics, AnomalyAlert
 import asyncio
+import time
 import aiohttp
 from typing import Dict, List, Optional
 from loguru import logger
-from dotenv import load_dotenv
-from datetime import datetime
+import numpy as np
 
-class SystemMetrics(Model):
-    """Real-time system metrics"""
-    system_id: str
-    cpu_usage: float
-    memory_usage: float
-    disk_usage: float
-    network_latency: float
-    error_count: int
-    timestamp: float
+# Anomaly kinds returned by detect_kernel
+KIND_NONE, KIND_CPU, KIND_ERRORS, KIND_MEMORY = 0, 1, 2, 3
 
-class AnomalyAlert(Model):
-    """Alert when anomaly detected"""
-    alert_id: str
-    severity: str  # "LOW", "MEDIUM", "HIGH", "CRITICAL"
-    system_id: str
-    metric_type: str
-    current_value: float
-    expected_value: float
-    confidence: float
-    timestamp: float
-    recommendation: str
+def detect_kernel(cpu, memory, errors, new, rows, baseline_cpu, baseline_memory, alpha):
+    """
+    Per-cycle anomaly math over plain arrays (no Python objects).
+    Classifies each polled system and applies the baseline EMA in place to
+    systems without an anomaly. Returns one KIND_* code per system.
+    """
+    base_cpu = baseline_cpu[rows]
+    base_memory = baseline_memory[rows]
+    
+    # Checks in priority order: CPU (2x normal), error spike, memory (1.8x normal)
+    cpu_hit = ~new & (cpu > base_cpu * 2.0)
+    error_hit = ~new & ~cpu_hit & (errors > 10)
+    memory_hit = ~new & ~cpu_hit & ~error_hit & (memory > base_memory * 1.8)
+    
+    kinds = np.zeros(cpu.shape[0], dtype=np.int8)
+    kinds[cpu_hit] = KIND_CPU
+    kinds[error_hit] = KIND_ERRORS
+    kinds[memory_hit] = KIND_MEMORY
+    
+    # Update baseline (exponential moving average) for systems without anomalies
+    quiet = ~new & (kinds == KIND_NONE)
+    baseline_cpu[rows[quiet]] = alpha * cpu[quiet] + (1 - alpha) * base_cpu[quiet]
+    baseline_memory[rows[quiet]] = alpha * memory[quiet] + (1 - alpha) * base_memory[quiet]
+    
+    return kinds
 
 class MonitoringAgent(BaseSuraAgent):
     def __init__(self):
-        load_dotenv()
         super().__init__(
             name="monitoring_agent",
             seed=os.getenv("MONITORING_SEED_PHRASE"),
@@ -42,10 +48,15 @@ class MonitoringAgent(BaseSuraAgent):
         )
         
         self.monitoring_interval = 5  # seconds
-        self.baseline_metrics: Dict[str, Dict] = {}
+        self.systems_refresh_cycles = 12  # re-fetch the systems list every minute
+        self.reset_baselines()
         self.anomaly_threshold = 0.8
         self.mock_infrastructure_url = "http://localhost:8000"  # Mock API
         
+        # Shared keep-alive session (opened at startup) and cap on in-flight polls
+        self.http: Optional[aiohttp.ClientSession] = None
+        self.max_concurrent_polls = 32
+        
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -54,53 +65,93 @@ class MonitoringAgent(BaseSuraAgent):
             logger.info(f"👁️  Monitoring Agent started at {self.agent.address}")
             ctx.storage.set("anomalies_detected", 0)
             
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300, keepalive_timeout=60)
+            )
+            
             # Start continuous monitoring
             asyncio.create_task(self.monitor_loop(ctx))
+        
+        @self.agent.on_event("shutdown")
+        async def shutdown(ctx: Context):
+            if self.http is not None:
+                await self.http.close()
     
     async def monitor_loop(self, ctx: Context):
-        """Continuous monitoring loop - pulls from mock infrastructure"""
+        """Continuous monitoring loop - pulls from mock infrastructure on a fixed cadence"""
         
-        # Get list of systems from mock infrastructure
+        # Get list of systems from mock infrastructure (refreshed every few cycles)
         systems = await self.get_monitored_systems()
         logger.info(f"📊 Monitoring {len(systems)} systems")
         
+        semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        cycle = 0
+        
         while True:
-            for system_id in systems:
-                try:
-                    # Collect real metrics from mock API
-                    metrics = await self.collect_metrics(system_id)
-                    
-                    # Detect anomalies
-                    anomaly = await self.detect_anomaly(system_id, metrics)
-                    
-                    if anomaly:
-                        logger.warning(f"🚨 ANOMALY DETECTED on {system_id}")
-                        logger.warning(f"   Metric: {anomaly.metric_type}")
-                        logger.warning(f"   Current: {anomaly.current_value:.2f}")
-                        logger.warning(f"   Expected: {anomaly.expected_value:.2f}")
-                        
-                        ctx.storage.set("anomalies_detected", 
-                                      ctx.storage.get("anomalies_detected") + 1)
-                        
-                        # Send alert to Response Agent
-                        await self.send_to_peer(ctx, "response_agent", anomaly)
+            cycle += 1
+            try:
+                if cycle % self.systems_refresh_cycles == 0:
+                    systems = await self.get_monitored_systems()
                 
-                except Exception as e:
-                    logger.error(f"Error monitoring {system_id}: {e}")
+                await self.poll_cycle(ctx, systems, semaphore)
+            
+            except Exception as e:
+                logger.error(f"Error in monitoring cycle: {e}")
+            
+            # Sleep until the next deadline so processing time doesn't stretch the period
+            next_tick += self.monitoring_interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                logger.warning("⏱️  Monitoring cycle overran by {:.2f}s", -delay)
+                next_tick = loop.time()  # resync instead of firing back-to-back cycles
+            else:
+                await asyncio.sleep(delay)
+    
+    async def poll_cycle(self, ctx: Context, systems: List[str], semaphore: asyncio.Semaphore):
+        """Poll every system once, detect anomalies and report them"""
+        # Collect real metrics from mock API - all systems concurrently,
+        # so cycle time is the slowest poll, not the sum
+        polled = await asyncio.gather(
+            *(self.poll_system(system_id, semaphore) for system_id in systems)
+        )
+        batch = [metrics for metrics in polled if metrics]
+        
+        # Detect anomalies for the whole cycle at once
+        anomalies = [alert for alert in self.detect_anomalies(batch) if alert]
+        if anomalies:
+            # One storage update per cycle, however many systems alerted
+            self.increment_counter(ctx, "anomalies_detected", len(anomalies))
+        
+        await asyncio.gather(*(self.report_anomaly(ctx, alert) for alert in anomalies))
+    
+    async def poll_system(self, system_id: str, semaphore: asyncio.Semaphore) -> Optional[SystemMetrics]:
+        """Collect metrics for one system, bounded by the shared semaphore"""
+        async with semaphore:
+            return await self.collect_metrics(system_id)
+    
+    async def report_anomaly(self, ctx: Context, anomaly: AnomalyAlert):
+        """Alert the Response Agent about one anomaly"""
+        try:
+            logger.warning("🚨 ANOMALY DETECTED on {} ({})", anomaly.system_id, anomaly.metric_type)
             
-            await asyncio.sleep(self.monitoring_interval)
+            # Send alert to Response Agent
+            await self.send_to_peer(ctx, "response_agent", anomaly)
+        
+        except Exception as e:
+            logger.error(f"Error monitoring {anomaly.system_id}: {e}")
     
     async def get_monitored_systems(self) -> List[str]:
         """Get list of systems from mock infrastructure"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.mock_infrastructure_url}/systems") as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return data.get("systems", [])[:10]  # Monitor first 10 for demo
-                    else:
-                        logger.error(f"Failed to get systems: {resp.status}")
-                        return []
+            async with self.http.get(f"{self.mock_infrastructure_url}/systems") as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    return data.get("systems", [])[:10]  # Monitor first 10 for demo
+                else:
+                    logger.error(f"Failed to get systems: {resp.status}")
+                    return []
         except Exception as e:
             logger.error(f"Failed to connect to mock infrastructure: {e}")
             return [f"server-{i}" for i in range(10)]  # Fallback
@@ -111,101 +162,120 @@ class MonitoringAgent(BaseSuraAgent):
         This replaces the psutil simulation
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.mock_infrastructure_url}/system/{system_id}"
-                ) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        
-                        # Extract metrics from mock infrastructure response
-                        return SystemMetrics(
-                            system_id=system_id,
-                            cpu_usage=data.get("cpu", 0.0),
-                            memory_usage=data.get("memory", 0.0),
-                            disk_usage=50.0,  # Mock doesn't track this yet
-                            network_latency=20.0,  # Can add to mock later
-                            error_count=0 if data.get("status") == "healthy" else 10,
-                            timestamp=datetime.now().timestamp()
-                        )
-                    else:
-                        logger.error(f"System {system_id} not found")
-                        return None
+            async with self.http.get(
+                f"{self.mock_infrastructure_url}/system/{system_id}"
+            ) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    
+                    # Extract metrics from mock infrastructure response
+                    return SystemMetrics(
+                        system_id=system_id,
+                        cpu_usage=data.get("cpu", 0.0),
+                        memory_usage=data.get("memory", 0.0),
+                        disk_usage=50.0,  # Mock doesn't track this yet
+                        network_latency=20.0,  # Can add to mock later
+                        error_count=0 if data.get("status") == "healthy" else 10,
+                        timestamp=time.time()
+                    )
+                else:
+                    logger.error(f"System {system_id} not found")
+                    return None
         
         except Exception as e:
             logger.error(f"Failed to collect metrics for {system_id}: {e}")
             return None
     
+    def reset_baselines(self):
+        """Clear learned baselines (SoA: one array per metric, one row per system)"""
+        self._rows: Dict[str, int] = {}
+        self.baseline_cpu = np.zeros(16)
+        self.baseline_memory = np.zeros(16)
+        self.baseline_errors = np.zeros(16)
+    
+    def _add_system(self, metrics: SystemMetrics) -> int:
+        """Assign a baseline row to a new system, growing the arrays by doubling"""
+        row = len(self._rows)
+        if row == len(self.baseline_cpu):
+            self.baseline_cpu = np.concatenate([self.baseline_cpu, np.zeros(row)])
+            self.baseline_memory = np.concatenate([self.baseline_memory, np.zeros(row)])
+            self.baseline_errors = np.concatenate([self.baseline_errors, np.zeros(row)])
+        
+        self._rows[metrics.system_id] = row
+        self.baseline_cpu[row] = metrics.cpu_usage
+        self.baseline_memory[row] = metrics.memory_usage
+        self.baseline_errors[row] = metrics.error_count
+        logger.info("📊 Established baseline for {}", metrics.system_id)
+        return row
+    
     async def detect_anomaly(self, system_id: str, metrics: SystemMetrics) -> Optional[AnomalyAlert]:
         """Detect if metrics indicate an anomaly"""
         
         if not metrics:
             return None
         
-        # Get or create baseline for this system
-        if system_id not in self.baseline_metrics:
-            self.baseline_metrics[system_id] = {
-                "cpu": metrics.cpu_usage,
-                "memory": metrics.memory_usage,
-                "latency": metrics.network_latency,
-                "errors": metrics.error_count
-            }
-            logger.info(f"📊 Established baseline for {system_id}")
-            return None
+        return self.detect_anomalies([metrics])[0]
+    
+    def detect_anomalies(self, batch: List[SystemMetrics]) -> List[Optional[AnomalyAlert]]:
+        """
+        Detect anomalies for a whole polling cycle at once.
+        Threshold checks and the baseline EMA run as array operations over all
+        systems; only anomalous rows are turned into AnomalyAlert objects.
+        """
+        n = len(batch)
+        alerts: List[Optional[AnomalyAlert]] = [None] * n
+        if n == 0:
+            return alerts
         
-        baseline = self.baseline_metrics[system_id]
-        
-        # Check for CPU anomaly (2x normal)
-        if metrics.cpu_usage > baseline["cpu"] * 2.0:
-            logger.warning(f"⚠️  CPU anomaly: {metrics.cpu_usage:.1f}% vs baseline {baseline['cpu']:.1f}%")
-            return AnomalyAlert(
-                alert_id=f"ALERT-{system_id}-{int(datetime.now().timestamp())}",
-                severity="HIGH",
-                system_id=system_id,
-                metric_type="CPU",
-                current_value=metrics.cpu_usage,
-                expected_value=baseline["cpu"],
-                confidence=0.9,
-                timestamp=datetime.now().timestamp(),
-                recommendation="INVESTIGATE_HIGH_CPU"
-            )
+        # Get or create baseline row for each system
+        rows = np.empty(n, dtype=np.intp)
+        new = np.zeros(n, dtype=bool)
+        for i, metrics in enumerate(batch):
+            row = self._rows.get(metrics.system_id)
+            if row is None:
+                row = self._add_system(metrics)
+                new[i] = True
+            rows[i] = row
         
-        # Check for error count spike
-        if metrics.error_count > 10:
-            logger.warning(f"⚠️  Error spike: {metrics.error_count} errors detected")
-            return AnomalyAlert(
-                alert_id=f"ALERT-{system_id}-{int(datetime.now().timestamp())}",
-                severity="CRITICAL",
-                system_id=system_id,
-                metric_type="ERRORS",
-                current_value=float(metrics.error_count),
-                expected_value=float(baseline["errors"]),
-                confidence=0.95,
-                timestamp=datetime.now().timestamp(),
-                recommendation="ROLLBACK_IMMEDIATELY"
-            )
+        cpu = np.fromiter((m.cpu_usage for m in batch), dtype=float, count=n)
+        memory = np.fromiter((m.memory_usage for m in batch), dtype=float, count=n)
+        errors = np.fromiter((m.error_count for m in batch), dtype=float, count=n)
+        base_cpu = self.baseline_cpu[rows]
+        base_memory = self.baseline_memory[rows]
+        base_errors = self.baseline_errors[rows]
         
-        # Check for memory anomaly
-        if metrics.memory_usage > baseline["memory"] * 1.8:
-            logger.warning(f"⚠️  Memory anomaly: {metrics.memory_usage:.1f}% vs baseline {baseline['memory']:.1f}%")
-            return AnomalyAlert(
-                alert_id=f"ALERT-{system_id}-{int(datetime.now().timestamp())}",
-                severity="MEDIUM",
-                system_id=system_id,
-                metric_type="MEMORY",
-                current_value=metrics.memory_usage,
-                expected_value=baseline["memory"],
-                confidence=0.85,
-                timestamp=datetime.now().timestamp(),
-                recommendation="INVESTIGATE_MEMORY_LEAK"
-            )
+        kinds = detect_kernel(
+            cpu, memory, errors, new, rows, self.baseline_cpu, self.baseline_memory, alpha=0.1
+        )
         
-        # Update baseline (exponential moving average)
-        alpha = 0.1
-        baseline["cpu"] = alpha * metrics.cpu_usage + (1 - alpha) * baseline["cpu"]
-        baseline["memory"] = alpha * metrics.memory_usage + (1 - alpha) * baseline["memory"]
+        now = time.time()
+        
+        # One construction site for every alert kind:
+        # (kind, severity, metric_type, current, expected, confidence, recommendation)
+        checks = (
+            (KIND_CPU, "HIGH", "CPU", cpu, base_cpu, 0.9, "INVESTIGATE_HIGH_CPU"),
+            (KIND_ERRORS, "CRITICAL", "ERRORS", errors, base_errors, 0.95, "ROLLBACK_IMMEDIATELY"),
+            (KIND_MEMORY, "MEDIUM", "MEMORY", memory, base_memory, 0.85, "INVESTIGATE_MEMORY_LEAK"),
+        )
+        for kind, severity, metric_type, current, expected, confidence, recommendation in checks:
+            for i in np.flatnonzero(kinds == kind):
+                system_id = batch[i].system_id
+                logger.warning("⚠️  {} anomaly on {}: {:.1f} vs baseline {:.1f}",
+                               metric_type, system_id, current[i], expected[i])
+                # Every field is already a plain str/float - skip pydantic validation
+                alerts[i] = AnomalyAlert.construct(
+                    alert_id=f"ALERT-{system_id}-{int(now)}",
+                    severity=severity,
+                    system_id=system_id,
+                    metric_type=metric_type,
+                    current_value=float(current[i]),
+                    expected_value=float(expected[i]),
+                    confidence=confidence,
+                    timestamp=now,
+                    recommendation=recommendation
+                )
         
-        return None
+        return alerts
 
 monitoring_agent = MonitoringAgent()
 agent = monitoring_agent.get_agent()
@@ -1,19 +1,28 @@
-from typing import Dict, Optional, List
-from dataclasses import dataclass, field
-import json
+from typing import Dict, Optional, List, FrozenSet, Iterable, Tuple
+from dataclasses import dataclass
+from contextlib import contextmanager
+import asyncio
+import atexit
+import threading
+import orjson
 import os
+import sys
 from loguru import logger
-from dotenv import load_dotenv
 from pathlib import Path
 
-@dataclass
+@dataclass(slots=True)
 class AgentInfo:
     name: str
     address: str
     port: int
-    capabilities: List[str]
+    capabilities: FrozenSet[str]
     status: str = "active"
     last_seen: float = 0.0
+    
+    def __post_init__(self):
+        # Accept any iterable (lists from callers or the JSON file); store as a set
+        # of interned names so index and membership lookups compare by identity
+        self.capabilities = frozenset(map(sys.intern, self.capabilities))
 
 class AgentRegistry:
     """
@@ -23,19 +32,79 @@ class AgentRegistry:
     
     def __init__(self, registry_file: str = "agent_registry.json"):
         self.agents: Dict[str, AgentInfo] = {}
+        # capability -> agent names; dict as an ordered set keeps registration order
+        self._by_capability: Dict[str, Dict[str, None]] = {}
+        self.version = 0  # bumped on every change so callers can cache lookups
+        self._fragments: Dict[str, bytes] = {}  # name -> serialized registry entry
+        self._rendered: Optional[Tuple[int, str]] = None  # (version, print_registry text)
         self.registry_file = registry_file
+        
+        # Mutations are appended to a write-ahead log right away; the full file is
+        # rewritten (and the log truncated) by a coalesced checkpoint
+        self.wal_file = f"{registry_file}.wal"
+        self._wal_fd: Optional[int] = None
+        self._wal_ops = 0
+        self.compact_every = 64  # checkpoint immediately once the log is this long
+        
+        # Write coalescing: mutations mark the registry dirty and one checkpoint follows
+        self.save_delay = 5.0  # seconds
+        self._dirty = False
+        self._batch_depth = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()  # checkpoints may run on a worker thread
+        atexit.register(self.close)
+        
         self.load_registry()
     
-    def register(self, name: str, address: str, port: int, capabilities: List[str]) -> None:
+    def register(self, name: str, address: str, port: int, capabilities: Iterable[str]) -> None:
         """Register an agent in the system"""
-        self.agents[name] = AgentInfo(
+        capabilities = list(capabilities)
+        invalid = [c for c in capabilities if not isinstance(c, str) or not c.strip()]
+        if invalid:
+            raise ValueError(f"Invalid capabilities for {name}: {invalid}")
+        if len(set(capabilities)) != len(capabilities):
+            logger.warning(f"⚠️  Duplicate capabilities for {name} dropped")
+        
+        self._add(AgentInfo(
             name=name,
             address=address,
             port=port,
             capabilities=capabilities
-        )
-        logger.info(f"✅ Registered: {name} at {address[:20]}... (port {port})")
-        self.save_registry()
+        ))
+        self._log_op({"op": "reg", **self._record(self.agents[name])})
+        logger.debug(f"✅ Registered: {name} at {address[:20]}... (port {port})")
+        self._schedule_save()
+    
+    def deregister(self, name: str) -> None:
+        """Remove an agent from the system"""
+        if self._remove(name):
+            self._log_op({"op": "dereg", "name": name})
+            logger.info(f"👋 Deregistered: {name}")
+            self._schedule_save()
+    
+    def _add(self, info: AgentInfo) -> None:
+        """Store an agent and index its capabilities (replaces any previous entry)"""
+        self._remove(info.name)
+        self.agents[info.name] = info
+        self._fragments.pop(info.name, None)
+        self.version += 1
+        for capability in info.capabilities:
+            self._by_capability.setdefault(capability, {})[info.name] = None
+    
+    def _remove(self, name: str) -> Optional[AgentInfo]:
+        """Drop an agent and its capability index entries"""
+        info = self.agents.pop(name, None)
+        self._fragments.pop(name, None)
+        if info:
+            self.version += 1
+            for capability in info.capabilities:
+                names = self._by_capability.get(capability)
+                if names:
+                    names.pop(name, None)
+                    if not names:
+                        del self._by_capability[capability]
+        return info
     
     def get_agent(self, name: str) -> Optional[AgentInfo]:
         """Get agent info by name"""
@@ -51,80 +120,224 @@ class AgentRegistry:
         return self.agents
     
     def get_agents_by_capability(self, capability: str) -> List[AgentInfo]:
-        """Find agents with specific capability"""
-        return [
-            agent for agent in self.agents.values() 
-            if capability in agent.capabilities
-        ]
+        """Find agents with specific capability, in registration order (inverted index lookup)"""
+        return [self.agents[name] for name in self._by_capability.get(capability, ())]
+    
+    @staticmethod
+    def _record(info: AgentInfo) -> Dict:
+        """Serializable form of an agent entry (registry file and log)"""
+        return {
+            "name": info.name,
+            "address": info.address,
+            "port": info.port,
+            "capabilities": sorted(info.capabilities),
+            "status": info.status
+        }
+    
+    def _log_op(self, op: Dict) -> None:
+        """Append one mutation to the write-ahead log (fsync happens at checkpoint)"""
+        try:
+            if self._wal_fd is None:
+                self._wal_fd = os.open(self.wal_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            os.write(self._wal_fd, orjson.dumps(op) + b"\n")
+            self._wal_ops += 1
+        except Exception as e:
+            logger.error(f"Failed to append to registry log: {e}")
+    
+    def _schedule_save(self) -> None:
+        """Mark the registry dirty and arrange for a single coalesced checkpoint"""
+        self._dirty = True
+        if self._batch_depth:
+            return  # batch() saves once on exit
+        
+        if self._wal_ops >= self.compact_every:
+            self.flush()
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()  # no event loop to debounce on - save now
+            return
+        
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.save_delay, self._start_async_flush)
+    
+    def flush(self) -> None:
+        """Checkpoint the registry if it has unsaved changes"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._dirty:
+            self._dirty = False
+            self.save_registry()
+    
+    def _start_async_flush(self) -> None:
+        """Timer callback: checkpoint without blocking the event loop"""
+        self._flush_handle = None
+        if self._dirty:
+            self._dirty = False
+            self._flush_task = asyncio.get_running_loop().create_task(self.asave_registry())
+    
+    def close(self) -> None:
+        """Write pending changes and release the write-ahead log descriptor"""
+        self.flush()
+        if self._wal_fd is not None:
+            os.close(self._wal_fd)
+            self._wal_fd = None
+    
+    @contextmanager
+    def batch(self):
+        """Group several mutations into one save on exit"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
     
     def save_registry(self) -> None:
-        """Persist registry to file"""
+        """Persist registry to file and truncate the write-ahead log it now covers"""
         try:
-            data = {
-                name: {
-                    "name": info.name,
-                    "address": info.address,
-                    "port": info.port,
-                    "capabilities": info.capabilities,
-                    "status": info.status
-                }
-                for name, info in self.agents.items()
-            }
+            self._write_snapshot(self._serialize())
+            self._truncate_wal()
+        except Exception as e:
+            logger.error(f"Failed to save registry: {e}")
+    
+    async def asave_registry(self) -> None:
+        """save_registry for use inside an event loop - disk I/O runs in a worker thread"""
+        try:
+            # Snapshot on the loop thread; only the write leaves it
+            payload = self._serialize()
+            ops = self._wal_ops
+            await asyncio.to_thread(self._write_snapshot, payload)
             
-            with open(self.registry_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
+            if self._wal_ops == ops:
+                self._truncate_wal()
+            else:
+                self._schedule_save()  # mutated mid-write - those ops aren't in the snapshot
         except Exception as e:
             logger.error(f"Failed to save registry: {e}")
     
+    def _serialize(self) -> bytes:
+        """Registry file contents; unchanged agents reuse their cached fragment"""
+        if not self.agents:
+            return b"{}"
+        
+        parts = []
+        for name, info in self.agents.items():
+            fragment = self._fragments.get(name)
+            if fragment is None:
+                # Same layout as dumping the whole dict with OPT_INDENT_2
+                body = orjson.dumps(self._record(info), option=orjson.OPT_INDENT_2)
+                fragment = b"  " + orjson.dumps(name) + b": " + body.replace(b"\n", b"\n  ")
+                self._fragments[name] = fragment
+            parts.append(fragment)
+        return b"{\n" + b",\n".join(parts) + b"\n}"
+    
+    def _write_snapshot(self, payload: bytes) -> None:
+        """Write once to a temp file, then swap it in - readers never see a half-written registry"""
+        with self._write_lock:
+            # (raw fd: no buffered file object between the one write and fsync)
+            tmp_file = f"{self.registry_file}.tmp"
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, payload)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_file, self.registry_file)
+    
+    def _truncate_wal(self) -> None:
+        if self._wal_fd is not None:
+            os.ftruncate(self._wal_fd, 0)
+        elif os.path.exists(self.wal_file):
+            os.truncate(self.wal_file, 0)
+        self._wal_ops = 0
+    
     def load_registry(self) -> None:
-        """Load registry from file"""
-        if not os.path.exists(self.registry_file):
+        """Load registry from file, then replay any logged mutations on top"""
+        if not os.path.exists(self.registry_file) and not os.path.exists(self.wal_file):
             logger.info("No existing registry found, starting fresh")
             return
         
         try:
-            with open(self.registry_file, 'r') as f:
-                data = json.load(f)
+            if os.path.exists(self.registry_file):
+                with open(self.registry_file, 'rb') as f:
+                    data = orjson.loads(f.read())
+                
+                for name, info in data.items():
+                    self._add(AgentInfo(**info))
             
-            for name, info in data.items():
-                self.agents[name] = AgentInfo(**info)
+            if os.path.exists(self.wal_file):
+                with open(self.wal_file, 'rb') as f:
+                    for line in f:
+                        self._replay(line)
+                self._dirty = self._wal_ops > 0  # fold the replayed log in at the next checkpoint
             
             logger.info(f"✅ Loaded {len(self.agents)} agents from registry")
             
         except Exception as e:
             logger.error(f"Failed to load registry: {e}")
     
+    def _replay(self, line: bytes) -> None:
+        """Apply one write-ahead log entry (a torn final line is skipped)"""
+        try:
+            entry = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return
+        
+        op = entry.pop("op")
+        if op == "reg":
+            self._add(AgentInfo(**entry))
+        elif op == "dereg":
+            self._remove(entry["name"])
+        elif op == "clear":
+            self.agents.clear()
+            self._by_capability.clear()
+            self._fragments.clear()
+            self.version += 1
+        self._wal_ops += 1
+    
     def clear_registry(self) -> None:
         """Clear all registered agents"""
         self.agents.clear()
-        self.save_registry()
+        self._by_capability.clear()
+        self._fragments.clear()
+        self.version += 1
+        self._log_op({"op": "clear"})
+        self._schedule_save()
         logger.info("🗑️  Registry cleared")
     
     def print_registry(self) -> None:
-        """Print all registered agents"""
-        print("\n" + "="*70)
-        print("📋 AGENT REGISTRY")
-        print("="*70)
+        """Print all registered agents (rendered once per registry version, one write)"""
+        if self._rendered is None or self._rendered[0] != self.version:
+            self._rendered = (self.version, self._render())
+        sys.stdout.write(self._rendered[1])
+    
+    def _render(self) -> str:
+        parts = ["\n" + "="*70, "📋 AGENT REGISTRY", "="*70]
         
         if not self.agents:
-            print("No agents registered")
-            return
+            parts.append("No agents registered")
+            return "\n".join(parts) + "\n"
         
         for name, info in self.agents.items():
-            print(f"\n🤖 {name.upper()}")
-            print(f"   Address: {info.address}")
-            print(f"   Port: {info.port}")
-            print(f"   Capabilities: {', '.join(info.capabilities)}")
-            print(f"   Status: {info.status}")
+            parts.append(f"\n🤖 {name.upper()}")
+            parts.append(f"   Address: {info.address}")
+            parts.append(f"   Port: {info.port}")
+            parts.append(f"   Capabilities: {', '.join(sorted(info.capabilities))}")
+            parts.append(f"   Status: {info.status}")
         
-        print("\n" + "="*70)
+        parts.append("\n" + "="*70)
+        return "\n".join(parts) + "\n"
 
 # Global registry instance
 registry = AgentRegistry()
 
 # Convenience functions for agents to use
-def register_agent(name: str, address: str, port: int, capabilities: List[str]) -> None:
+def register_agent(name: str, address: str, port: int, capabilities: Iterable[str]) -> None:
     """Register this agent in the global registry"""
     registry.register(name, address, port, capabilities)
 
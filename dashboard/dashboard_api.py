@@ -59,7 +59,11 @@ async def get_metrics():
         monitoring = json.loads(Path("agent1q0sx9t9aqp_data.json").read_text())
         response = json.loads(Path("agent1qg92f9k4tj_data.json").read_text())
         communication = json.loads(Path("agent1qvgnwew95l_data.json").read_text())
-        status_page = json.loads(Path("status_page.json").read_text())
+        status_page = [
+            json.loads(line)
+            for line in Path("status_page.jsonl").read_text().splitlines()
+            if line.strip()
+        ]
 
         ai_accuracy = (canary.get("ai_decisions", 0) / max(canary.get("tests_run", 1), 1)) * 100
 
@@ -10,7 +10,7 @@ Prerequisites:
 """
 import asyncio
 import aiohttp
-from uagents import Agent, Context, Model
+from uagents import Agent, Context
 from agents.messages import (  # ← CHANGE THIS
     UpdatePackage,
     CanaryTestResult,
@@ -65,47 +65,6 @@ AGENTVERSE_ADDRESSES = load_agent_addresses()
 MOCK_API = "http://localhost:8000"
 WAIT_TIME_PER_SCENARIO = 35  # Give more time for Agentverse routing
 
-# ============================================================================
-# MESSAGE MODELS
-# ============================================================================
-
-
-class CanaryTestResult(Model):
-    update_id: str
-    success: bool
-    affected_systems: int
-    error_rate: float
-    latency_impact: float
-    recommendation: str
-    details: str
-
-class AnomalyAlert(Model):
-    alert_id: str
-    severity: str
-    system_id: str
-    metric_type: str
-    current_value: float
-    expected_value: float
-    confidence: float
-    timestamp: float
-    recommendation: str
-
-class ResponseAction(Model):
-    action_id: str
-    action_type: str
-    target_systems: List[str]
-    reason: str
-    status: str
-    timestamp: float
-
-class StatusUpdate(Model):
-    incident_id: str
-    status: str
-    title: str
-    description: str
-    affected_services: List[str]
-    timestamp: float
-
 # ============================================================================
 # TEST ORCHESTRATOR
 # ============================================================================
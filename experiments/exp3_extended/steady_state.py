@@ -30,14 +30,14 @@ NON_ACTIONS = {"NONE", "INVESTIGATE"}
 
 
 def make_monitor():
-    """A MonitoringAgent shell with a live baseline dict but no uAgent/network.
+    """A MonitoringAgent shell with live baseline arrays but no uAgent/network.
 
-    detect_anomaly only touches self.baseline_metrics, so an uninitialized
-    instance runs the real detection logic faithfully.
+    detect_anomaly only touches the baseline arrays set up by reset_baselines,
+    so an uninitialized instance runs the real detection logic faithfully.
     """
     from agents.monitoring.monitoring_agent import MonitoringAgent, SystemMetrics
     mon = MonitoringAgent.__new__(MonitoringAgent)
-    mon.baseline_metrics = {}
+    mon.reset_baselines()
     return mon, SystemMetrics
 
 
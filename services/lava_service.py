@@ -4,13 +4,40 @@ FIXED VERSION - Correct model and Anthropic response format
 """
 
 import os
+import asyncio
 import aiohttp
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 from loguru import logger
 import json
+import orjson
 from dotenv import load_dotenv
 load_dotenv()
 
+SRE_PREAMBLE = "You are an expert SRE AI. Respond ONLY with valid JSON. No markdown, no code blocks, just pure JSON.\n\n"
+
+# Incident prompt, preamble included - only the alert fields are filled in per call
+INCIDENT_PROMPT = SRE_PREAMBLE + """Analyze this production incident and respond ONLY with valid JSON (no markdown formatting).
+
+Incident Data:
+- Alert ID: {alert_id}
+- Severity: {severity}
+- System: {system_id}
+- Metric: {metric_type}
+- Current Value: {current_value}
+- Expected Value: {expected_value}
+- Confidence: {confidence:.2f}
+
+Respond with ONLY this JSON (no code blocks, no markdown):
+{{
+    "severity": "HIGH",
+    "root_cause": "brief description",
+    "recommendation": "ROLLBACK",
+    "confidence": 0.85,
+    "reasoning": "one sentence explanation"
+}}
+
+Choose recommendation from: ROLLBACK, FAILOVER, SCALE_UP, ISOLATE, INVESTIGATE, RESTART"""
+
 class LavaAIService:
     """Integration with Lava Gateway - Claude through Lava's infrastructure"""
     
@@ -28,6 +55,18 @@ class LavaAIService:
         # Check if Lava is available
         self.available = bool(self.lava_token)
         
+        # Request parts that never change between calls
+        self._headers = {
+            "Authorization": f"Bearer {self.lava_token}",
+            "Content-Type": "application/json",
+            "anthropic-version": "2023-06-01"  # Required for Anthropic API
+        }
+        self._timeout = aiohttp.ClientTimeout(total=30)
+        
+        # Pooled HTTP session, created lazily inside the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        
         if self.available:
             logger.info(f"🌊 Lava AI Service initialized")
             logger.info(f"   Model: {self.model}")
@@ -38,9 +77,41 @@ class LavaAIService:
             logger.warning("⚠️  LAVA_FORWARD_TOKEN not set - AI features disabled")
             logger.info("   System will use rule-based decisions")
     
-    async def analyze_incident(self, incident_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Shared session so repeated calls reuse pooled keep-alive connections"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60)
+            )
+            self._session_loop = loop
+        return self._session
+    
+    def _request_body(self, content: str, max_tokens: int = 1024) -> bytes:
+        """Anthropic messages request for one user prompt, serialized in one pass"""
+        return orjson.dumps({
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            "messages": [{"role": "user", "content": content}]
+        })
+    
+    def _client_timeout(self, timeout: Optional[float], max_tokens: int = 1024) -> aiohttp.ClientTimeout:
+        """Per-request timeout: `timeout` budgets a 1024-token answer and grows with max_tokens"""
+        if timeout is None:
+            return self._timeout
+        return aiohttp.ClientTimeout(total=timeout * max(1.0, max_tokens / 1024))
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def analyze_incident(self, incident_data: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze incident using Claude Sonnet 3.5 through Lava
+        With an explicit `timeout`, a request that exceeds it raises asyncio.TimeoutError
         """
         if not self.available:
             logger.warning("❌ Lava not available - no token!")
@@ -49,108 +120,96 @@ class LavaAIService:
         prompt = self._build_incident_prompt(incident_data)
         
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": f"Bearer {self.lava_token}",
-                    "Content-Type": "application/json",
-                    "anthropic-version": "2023-06-01"  # Required for Anthropic API
-                }
+            session = self._get_session()
+            
+            logger.info(f"🌊 Sending request to Lava...")
+            logger.debug(f"   URL: {self.lava_url}")
+            logger.debug(f"   Model: {self.model}")
+            
+            async with session.post(
+                self.lava_url,
+                headers=self._headers,
+                data=self._request_body(prompt),
+                timeout=self._client_timeout(timeout)
+            ) as resp:
+                
+                response_text = await resp.text()
+                
+                if resp.status != 200:
+                    logger.error(f"❌ Lava error ({resp.status})")
+                    logger.error(f"   Response: {response_text[:200]}")
+                    return self._fallback_response()
                 
-                # Anthropic message format
-                payload = {
-                    "model": self.model,
-                    "max_tokens": 1024,
-                    "temperature": 0.1,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": f"You are an expert SRE AI. Respond ONLY with valid JSON. No markdown, no code blocks, just pure JSON.\n\n{prompt}"
-                        }
-                    ]
-                }
+                # Get Lava request ID from headers
+                lava_request_id = resp.headers.get('x-lava-request-id', '')
+                if lava_request_id:
+                    logger.info(f"✅ Lava Request ID: {lava_request_id}")
+                else:
+                    logger.warning(f"⚠️  No x-lava-request-id header found")
                 
-                logger.info(f"🌊 Sending request to Lava...")
-                logger.debug(f"   URL: {self.lava_url}")
-                logger.debug(f"   Model: {self.model}")
+                try:
+                    response_data = json.loads(response_text)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Failed to parse Lava response as JSON: {e}")
+                    logger.error(f"Raw response: {response_text[:500]}")
+                    return self._fallback_response()
                 
-                async with session.post(
-                    self.lava_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as resp:
+                # FIXED: Extract Claude's response using Anthropic format
+                try:
+                    # Anthropic returns: {"content": [{"type": "text", "text": "..."}], "role": "assistant"}
+                    if 'content' in response_data and isinstance(response_data['content'], list):
+                        # Get text from first content block
+                        content = response_data['content'][0]['text']
+                        logger.debug(f"Claude response: {content[:200]}")
+                    else:
+                        logger.error(f"Unexpected Anthropic response structure")
+                        logger.error(f"Response keys: {response_data.keys()}")
+                        return self._fallback_response()
                     
-                    response_text = await resp.text()
+                except (KeyError, IndexError, TypeError) as e:
+                    logger.error(f"Failed to extract content: {e}")
+                    logger.error(f"Response data: {response_data}")
+                    return self._fallback_response()
+                
+                # Parse Claude's JSON response
+                try:
+                    # Remove markdown code blocks if present
+                    if content.startswith('```'):
+                        content = content.split('```')[1]
+                        if content.startswith('json'):
+                            content = content[4:]
                     
-                    if resp.status != 200:
-                        logger.error(f"❌ Lava error ({resp.status})")
-                        logger.error(f"   Response: {response_text[:200]}")
-                        return self._fallback_response()
+                    analysis = json.loads(content.strip())
                     
-                    # Get Lava request ID from headers
-                    lava_request_id = resp.headers.get('x-lava-request-id', '')
-                    if lava_request_id:
-                        logger.info(f"✅ Lava Request ID: {lava_request_id}")
-                    else:
-                        logger.warning(f"⚠️  No x-lava-request-id header found")
+                    # Add metadata
+                    analysis['lava_request_id'] = lava_request_id
+                    analysis['ai_provider'] = 'Claude Sonnet 3.5 (via Lava)'
                     
-                    try:
-                        response_data = json.loads(response_text)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse Lava response as JSON: {e}")
-                        logger.error(f"Raw response: {response_text[:500]}")
-                        return self._fallback_response()
+                    # Ensure required fields
+                    if 'recommendation' not in analysis:
+                        analysis['recommendation'] = 'INVESTIGATE'
+                    if 'confidence' not in analysis:
+                        analysis['confidence'] = 0.75
+                    if 'reasoning' not in analysis:
+                        analysis['reasoning'] = 'AI analysis completed'
                     
-                    # FIXED: Extract Claude's response using Anthropic format
-                    try:
-                        # Anthropic returns: {"content": [{"type": "text", "text": "..."}], "role": "assistant"}
-                        if 'content' in response_data and isinstance(response_data['content'], list):
-                            # Get text from first content block
-                            content = response_data['content'][0]['text']
-                            logger.debug(f"Claude response: {content[:200]}")
-                        else:
-                            logger.error(f"Unexpected Anthropic response structure")
-                            logger.error(f"Response keys: {response_data.keys()}")
-                            return self._fallback_response()
-                        
-                    except (KeyError, IndexError, TypeError) as e:
-                        logger.error(f"Failed to extract content: {e}")
-                        logger.error(f"Response data: {response_data}")
-                        return self._fallback_response()
+                    logger.info(f"✅ Claude analysis successful!")
+                    logger.info(f"   Recommendation: {analysis.get('recommendation')}")
+                    logger.info(f"   Confidence: {analysis.get('confidence'):.2f}")
                     
-                    # Parse Claude's JSON response
-                    try:
-                        # Remove markdown code blocks if present
-                        if content.startswith('```'):
-                            content = content.split('```')[1]
-                            if content.startswith('json'):
-                                content = content[4:]
-                        
-                        analysis = json.loads(content.strip())
-                        
-                        # Add metadata
-                        analysis['lava_request_id'] = lava_request_id
-                        analysis['ai_provider'] = 'Claude Sonnet 3.5 (via Lava)'
-                        
-                        # Ensure required fields
-                        if 'recommendation' not in analysis:
-                            analysis['recommendation'] = 'INVESTIGATE'
-                        if 'confidence' not in analysis:
-                            analysis['confidence'] = 0.75
-                        if 'reasoning' not in analysis:
-                            analysis['reasoning'] = 'AI analysis completed'
-                        
-                        logger.info(f"✅ Claude analysis successful!")
-                        logger.info(f"   Recommendation: {analysis.get('recommendation')}")
-                        logger.info(f"   Confidence: {analysis.get('confidence'):.2f}")
-                        
-                        return analysis
-                        
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"Claude response not valid JSON: {e}")
-                        logger.warning(f"Content: {content[:300]}")
-                        return self._parse_natural_language_response(content, lava_request_id)
-            
+                    return analysis
+                    
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Claude response not valid JSON: {e}")
+                    logger.warning(f"Content: {content[:300]}")
+                    return self._parse_natural_language_response(content, lava_request_id)
+
+        except asyncio.TimeoutError:
+            if timeout is not None:
+                logger.warning(f"⏱️  Lava request timed out after {timeout:.1f}s")
+                raise
+            logger.error(f"❌ Lava request timed out")
+            return self._fallback_response()
         except aiohttp.ClientError as e:
             logger.error(f"❌ Lava connection error: {e}")
             return self._fallback_response()
@@ -160,29 +219,117 @@ class LavaAIService:
             traceback.print_exc()
             return self._fallback_response()
     
-    def _build_incident_prompt(self, incident_data: Dict[str, Any]) -> str:
-        """Build optimized prompt for Claude via Lava"""
-        return f"""Analyze this production incident and respond ONLY with valid JSON (no markdown formatting).
+    async def analyze_incidents_batch(
+        self, incidents: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> List[Union[Dict[str, Any], BaseException]]:
+        """
+        Analyze several correlated incidents with a single Lava request.
+        Returns one analysis per incident, in order; all share the request ID.
+        Falls back to one request per incident if the batched answer can't be matched up.
+        `timeout` applies to each HTTP request (scaled by answer size); an incident
+        whose own fallback request times out gets its asyncio.TimeoutError in its slot.
+        """
+        if len(incidents) == 1:
+            return [await self.analyze_incident(incidents[0], timeout=timeout)]
+        
+        if not self.available:
+            logger.warning("❌ Lava not available - no token!")
+            return [self._fallback_response() for _ in incidents]
+        
+        try:
+            session = self._get_session()
+            max_tokens = 256 * len(incidents) + 256
+            body = self._request_body(
+                SRE_PREAMBLE + self._build_batch_prompt(incidents),
+                max_tokens=max_tokens
+            )
+            
+            logger.info(f"🌊 Sending batched request for {len(incidents)} incidents to Lava...")
+            
+            async with session.post(
+                self.lava_url,
+                headers=self._headers,
+                data=body,
+                timeout=self._client_timeout(timeout, max_tokens)
+            ) as resp:
+                
+                if resp.status != 200:
+                    response_text = await resp.text()
+                    logger.error(f"❌ Lava error ({resp.status}): {response_text[:200]}")
+                    return [self._fallback_response() for _ in incidents]
+                
+                lava_request_id = resp.headers.get('x-lava-request-id', '')
+                response_data = await resp.json()
+                content = response_data['content'][0]['text']
+            
+            # Parse JSON response
+            if content.startswith('```'):
+                content = content.split('```')[1]
+                if content.startswith('json'):
+                    content = content[4:]
+            
+            analyses = json.loads(content.strip())
+            if not isinstance(analyses, list) or len(analyses) != len(incidents):
+                raise ValueError(f"expected {len(incidents)} analyses, got {type(analyses).__name__}")
+            
+            for analysis in analyses:
+                analysis['lava_request_id'] = lava_request_id
+                analysis['ai_provider'] = 'Claude Sonnet 3.5 (via Lava)'
+                analysis.setdefault('recommendation', 'INVESTIGATE')
+                analysis.setdefault('confidence', 0.75)
+                analysis.setdefault('reasoning', 'AI analysis completed')
+            
+            logger.info(f"✅ Claude batch analysis successful ({len(analyses)} incidents)")
+            return analyses
+        
+        except Exception as e:
+            logger.warning(f"Batched analysis failed ({type(e).__name__}: {e}) - analyzing individually")
+            return list(await asyncio.gather(
+                *(self.analyze_incident(incident, timeout=timeout) for incident in incidents),
+                return_exceptions=True
+            ))
+    
+    def _build_batch_prompt(self, incidents: List[Dict[str, Any]]) -> str:
+        """Prompt covering several incidents; asks for a JSON array in the same order"""
+        listed = "\n\n".join(
+            f"""Incident {i}:
+- Alert ID: {incident.get('alert_id')}
+- Severity: {incident.get('severity')}
+- System: {incident.get('system_id')}
+- Metric: {incident.get('metric_type')}
+- Current Value: {incident.get('current_value')}
+- Expected Value: {incident.get('expected_value')}
+- Confidence: {incident.get('confidence', 0):.2f}"""
+            for i, incident in enumerate(incidents, 1)
+        )
+        return f"""Analyze these {len(incidents)} production incidents, which arrived together and may share a root cause. Respond ONLY with valid JSON (no markdown formatting).
 
-Incident Data:
-- Alert ID: {incident_data.get('alert_id')}
-- Severity: {incident_data.get('severity')}
-- System: {incident_data.get('system_id')}
-- Metric: {incident_data.get('metric_type')}
-- Current Value: {incident_data.get('current_value')}
-- Expected Value: {incident_data.get('expected_value')}
-- Confidence: {incident_data.get('confidence', 0):.2f}
+{listed}
 
-Respond with ONLY this JSON (no code blocks, no markdown):
-{{
-    "severity": "HIGH",
-    "root_cause": "brief description",
-    "recommendation": "ROLLBACK",
-    "confidence": 0.85,
-    "reasoning": "one sentence explanation"
-}}
+Respond with ONLY a JSON array holding exactly one object per incident, in the same order (no code blocks, no markdown):
+[
+    {{
+        "severity": "HIGH",
+        "root_cause": "brief description",
+        "recommendation": "ROLLBACK",
+        "confidence": 0.85,
+        "reasoning": "one sentence explanation"
+    }}
+]
 
-Choose recommendation from: ROLLBACK, FAILOVER, SCALE_UP, ISOLATE, INVESTIGATE, RESTART"""
+Choose each recommendation from: ROLLBACK, FAILOVER, SCALE_UP, ISOLATE, INVESTIGATE, RESTART"""
+    
+    def _build_incident_prompt(self, incident_data: Dict[str, Any]) -> str:
+        """Build optimized prompt for Claude via Lava (preamble included)"""
+        return INCIDENT_PROMPT.format(
+            alert_id=incident_data.get('alert_id'),
+            severity=incident_data.get('severity'),
+            system_id=incident_data.get('system_id'),
+            metric_type=incident_data.get('metric_type'),
+            current_value=incident_data.get('current_value'),
+            expected_value=incident_data.get('expected_value'),
+            confidence=incident_data.get('confidence', 0)
+        )
     
     def _parse_natural_language_response(self, content: str, lava_request_id: str) -> Dict[str, Any]:
         """Parse natural language response if JSON parsing fails"""
@@ -266,53 +413,39 @@ Choose recommendation from: ROLLBACK, FAILOVER, SCALE_UP, ISOLATE, INVESTIGATE,
         deployment_data['metric_type'] = 'CANARY_TEST'
         
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": f"Bearer {self.lava_token}",
-                    "Content-Type": "application/json",
-                    "anthropic-version": "2023-06-01"
-                }
+            session = self._get_session()
+            body = self._request_body(
+                f"You are an expert SRE AI. Respond ONLY with valid JSON. No markdown, no code blocks.\n\n{prompt}"
+            )
+            
+            async with session.post(
+                self.lava_url,
+                headers=self._headers,
+                data=body,
+                timeout=self._timeout
+            ) as resp:
                 
-                payload = {
-                    "model": self.model,
-                    "max_tokens": 1024,
-                    "temperature": 0.1,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": f"You are an expert SRE AI. Respond ONLY with valid JSON. No markdown, no code blocks.\n\n{prompt}"
-                        }
-                    ]
-                }
+                if resp.status != 200:
+                    response_text = await resp.text()
+                    logger.error(f"Lava error ({resp.status}): {response_text[:200]}")
+                    return self._fallback_response()
+                
+                lava_request_id = resp.headers.get('x-lava-request-id', '')
+                response_data = await resp.json()
+                content = response_data['content'][0]['text']
+                
+                # Parse JSON response
+                if content.startswith('```'):
+                    content = content.split('```')[1]
+                    if content.startswith('json'):
+                        content = content[4:]
+                
+                analysis = json.loads(content.strip())
+                analysis['lava_request_id'] = lava_request_id
+                analysis['ai_provider'] = 'Claude Sonnet 3.5 (via Lava)'
+                
+                return analysis
                 
-                async with session.post(
-                    self.lava_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as resp:
-                    
-                    if resp.status != 200:
-                        response_text = await resp.text()
-                        logger.error(f"Lava error ({resp.status}): {response_text[:200]}")
-                        return self._fallback_response()
-                    
-                    lava_request_id = resp.headers.get('x-lava-request-id', '')
-                    response_data = await resp.json()
-                    content = response_data['content'][0]['text']
-                    
-                    # Parse JSON response
-                    if content.startswith('```'):
-                        content = content.split('```')[1]
-                        if content.startswith('json'):
-                            content = content[4:]
-                    
-                    analysis = json.loads(content.strip())
-                    analysis['lava_request_id'] = lava_request_id
-                    analysis['ai_provider'] = 'Claude Sonnet 3.5 (via Lava)'
-                    
-                    return analysis
-                    
         except Exception as e:
             logger.error(f"Canary AI analysis failed: {e}")
             return self._fallback_response()